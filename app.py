@@ -2,13 +2,12 @@ import streamlit as st
 import asyncio
 import os
 import sys
+import threading
 from dotenv import load_dotenv
 
 # Add the parent directory to the path to import modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.github_agent import GitHubRepositoryAgent
-
 load_dotenv()
 
 st.set_page_config(
@@ -17,6 +16,49 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def get_agent():
+    """Create the agent once per process so its HTTP connection pools are shared across sessions."""
+    # Imported here so the langchain/langgraph stack isn't touched on every script rerun
+    from src.github_agent import GitHubRepositoryAgent
+    return GitHubRepositoryAgent()
+
+def create_memory(llm):
+    """Create chat memory that summarizes older turns once it exceeds the token budget."""
+    from langchain.memory import ConversationSummaryBufferMemory
+    from langchain_community.chat_message_histories import StreamlitChatMessageHistory
+    return ConversationSummaryBufferMemory(
+        llm=llm,
+        max_token_limit=4000,
+        chat_memory=StreamlitChatMessageHistory(key="chat_history")
+    )
+
+@st.cache_resource
+def get_event_loop():
+    """Start one long-lived event loop in a background thread.
+
+    The shared agent's HTTP clients and rate-limiter state are bound to this loop,
+    so keep-alive connections survive across chat turns and sessions.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def stream_response(events, loop, response):
+    """Drive the agent's async event stream, yielding text for st.write_stream.
+
+    The final result event is copied into ``response``.
+    """
+    while True:
+        try:
+            event = asyncio.run_coroutine_threadsafe(events.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+        if "delta" in event:
+            yield event["delta"]
+        else:
+            response.update(event["result"])
+
 def main():
     st.title("🔍 GitHub Repository Finder")
     st.markdown("Find the best GitHub repositories for your needs using AI-powered search and analysis!")
@@ -30,21 +72,23 @@ def main():
         st.session_state.stored_repositories = []
     if "agent" not in st.session_state:
         try:
-            st.session_state.agent = GitHubRepositoryAgent()
+            st.session_state.agent = get_agent()
         except Exception as e:
             st.error(f"Failed to initialize agent: {str(e)}")
             st.info("Please check your API keys in the .env file")
             return
+    if "memory" not in st.session_state:
+        st.session_state.memory = create_memory(st.session_state.agent.openai_client)
 
     # Display chat messages
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
             # Redisplay diagram if it exists in this message
-            if "diagram_path" in message and message["diagram_path"]:
+            if message.get("diagram"):
                 st.subheader("🏗️ Class Diagram")
                 try:
-                    st.image(message["diagram_path"], caption="Generated Class Diagram", use_column_width=True)
+                    st.image(message["diagram"], caption="Generated Class Diagram", use_column_width=True)
                 except Exception as e:
                     st.warning(f"Could not display diagram: {str(e)}")
 
@@ -59,22 +103,24 @@ def main():
         with st.chat_message("assistant"):
             with st.spinner("Processing your request..."):
                 try:
-                    response = asyncio.run(st.session_state.agent.find_repositories(
-                        prompt, 
+                    response = {}
+                    events = st.session_state.agent.find_repositories(
+                        prompt,
                         st.session_state.thread_id,
-                        st.session_state.stored_repositories
-                    ))
-                    st.markdown(response["message"])
+                        st.session_state.stored_repositories,
+                        st.session_state.memory.load_memory_variables({})["history"]
+                    )
+                    st.write_stream(stream_response(events, get_event_loop(), response))
 
                     # Store repositories in session state for diagram requests
                     if "repositories" in response and response["repositories"]:
                         st.session_state.stored_repositories = response["repositories"]
 
                     # Display class diagram if generated
-                    if "diagram_path" in response and response["diagram_path"]:
+                    if response.get("diagram"):
                         st.subheader("🏗️ Class Diagram")
                         try:
-                            st.image(response["diagram_path"], caption="Generated Class Diagram", use_column_width=True)
+                            st.image(response["diagram"], caption="Generated Class Diagram", use_column_width=True)
                         except Exception as e:
                             st.warning(f"Could not display diagram: {str(e)}")
 
@@ -98,10 +144,14 @@ def main():
                                 st.write("**Description:**", repo["description"] or "No description available")
                                 st.write("**URL:**", f"[{repo['url']}]({repo['url']})")
 
+                    st.session_state.memory.save_context(
+                        {"input": prompt},
+                        {"output": response["message"]}
+                    )
                     st.session_state.messages.append({
                         "role": "assistant", 
                         "content": response["message"],
-                        "diagram_path": response.get("diagram_path")
+                        "diagram": response.get("diagram")
                     })
 
                 except Exception as e:
@@ -110,7 +160,7 @@ def main():
                     st.session_state.messages.append({
                         "role": "assistant", 
                         "content": error_msg,
-                        "diagram_path": None
+                        "diagram": None
                     })
 
     # Sidebar with instructions
@@ -137,6 +187,7 @@ def main():
         Make sure to set up your `.env` file with:
         - `OPENAI_API_KEY`
         - `GITHUB_TOKEN` (optional, for higher rate limits)
+        - `GITHUB_TOKENS` (optional, comma-separated tokens to pool their rate limits)
         """)
 
 if __name__ == "__main__":
@@ -22,8 +22,30 @@ SCORING_WEIGHTS = {
 # Rate limiting settings
 RATE_LIMIT_SETTINGS = {
     "requests_per_minute": 30,
-    "batch_size": 5,
-    "delay_between_batches": 0.5
+    "max_concurrent": 10,
+    # GitHub API pacing, retries and rate-limit header handling
+    "max_in_flight": 10,
+    "max_retries": 5,
+    "backoff_base": 1.0,
+    "pacing_threshold": 0.1,
+    "max_reset_wait": 60
+}
+
+# GitHub API response cache (in-memory LRU backed by SQLite)
+CACHE_SETTINGS = {
+    "http_cache_path": "github_cache.db",
+    # Total response body bytes held in memory; larger bodies are served from disk
+    "memory_bytes": 32 * 1024 * 1024,
+    "disk_entries": 10000,
+    "search_ttl": 600,
+    "default_ttl": 3600,
+    # How long a stale entry is kept for ETag revalidation before it is deleted
+    "max_stale": 86400
+}
+
+# LangGraph workflow checkpoints (SQLite)
+CHECKPOINT_SETTINGS = {
+    "path": "checkpoints.db"
 }
 
 # OpenAI model settings
@@ -45,4 +67,5 @@ def get_env_vars() -> Dict[str, Any]:
     return {
         "openai_api_key": os.getenv("OPENAI_API_KEY"),
         "github_token": os.getenv("GITHUB_TOKEN"),
+        "github_tokens": os.getenv("GITHUB_TOKENS"),
     }
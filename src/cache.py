@@ -0,0 +1,185 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional
+import aiosqlite
+
+
+def connect_sqlite(path: str) -> aiosqlite.Connection:
+    """Create an unopened aiosqlite connection to ``path``.
+
+    Its worker thread is a daemon so a connection that is never closed doesn't
+    hold the process open at exit.
+    """
+    db = aiosqlite.connect(path)
+    db.daemon = True
+    return db
+
+
+class TTLCache:
+    """Small in-process LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for ``key``, or None if missing or expired."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` under ``key``, evicting the least recently used entry if full."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CachedResponse(NamedTuple):
+    """A cached HTTP response body with its validator and freshness deadline.
+
+    ``credential`` identifies (by hash) the token the ETag was issued to, since
+    GitHub only answers 304 to a revalidation made with the same credential.
+    ``link`` keeps the pagination header, which page counts are read from.
+    """
+
+    etag: Optional[str]
+    body: bytes
+    expires_at: float
+    credential: Optional[str] = None
+    link: Optional[str] = None
+
+
+class ResponseCache:
+    """Two-level HTTP response cache: an in-memory LRU in front of a SQLite file.
+
+    Entries are kept after they go stale so they can be revalidated with their ETag,
+    but only for ``max_stale`` seconds; the file is also capped at ``max_rows`` rows,
+    dropping the entries that expire soonest. Both are enforced when the database is
+    opened and every ``PRUNE_EVERY`` writes after that.
+
+    The memory layer is capped at ``max_bytes`` of response bodies; a body larger
+    than a sixteenth of that is only kept on disk so it can't flush the rest.
+    """
+
+    SCHEMA_VERSION = 3
+    PRUNE_EVERY = 256
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_rows: int = 10000,
+        max_stale: float = 86400.0
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.max_stale = max_stale
+        self._memory: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._memory_bytes = 0
+        self._db: Optional[aiosqlite.Connection] = None
+        self._db_lock = asyncio.Lock()
+        self._writes = 0
+
+    async def _connection(self) -> aiosqlite.Connection:
+        """Open the SQLite database on first use."""
+        async with self._db_lock:
+            if self._db is None:
+                db = connect_sqlite(self.path)
+                await db
+                # It's only a cache, so a file from an older layout is simply rebuilt
+                async with db.execute("PRAGMA user_version") as cursor:
+                    (version,) = await cursor.fetchone()
+                if version != self.SCHEMA_VERSION:
+                    await db.execute("DROP TABLE IF EXISTS responses")
+                    await db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+                await db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, etag TEXT, body BLOB, expires_at REAL, credential TEXT, link TEXT)"
+                )
+                await self._prune(db)
+                self._db = db
+            return self._db
+
+    async def _prune(self, db: aiosqlite.Connection) -> None:
+        """Delete entries stale beyond revalidation and trim the table to ``max_rows``."""
+        await db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time() - self.max_stale,))
+        await db.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY expires_at DESC LIMIT ?)",
+            (self.max_rows,)
+        )
+        await db.commit()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        """Return the cached response for ``key``, fresh or stale, if any."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+
+        db = await self._connection()
+        async with db.execute(
+            "SELECT etag, body, expires_at, credential, link FROM responses WHERE key = ?", (key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+
+        entry = CachedResponse(*row)
+        self._remember(key, entry)
+        return entry
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        """Store ``entry`` in memory and on disk."""
+        self._remember(key, entry)
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR REPLACE INTO responses (key, etag, body, expires_at, credential, link) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, *entry)
+        )
+        await db.commit()
+
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            await self._prune(db)
+
+    def _remember(self, key: str, entry: CachedResponse) -> None:
+        """Keep ``entry`` in the memory layer, evicting the least recently used bodies."""
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous.body)
+        if len(entry.body) > self.max_bytes // 16:
+            return
+
+        self._memory[key] = entry
+        self._memory_bytes += len(entry.body)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.body)
+
+    async def aclose(self) -> None:
+        """Close the SQLite connection."""
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
@@ -1,22 +1,56 @@
 import os
+import re
+import asyncio
+import hashlib
 import tempfile
 from typing import Dict, Any, Optional
 import graphviz
-from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
+from src.cache import TTLCache
+from src.llm import get_chat_model
+
+# Rendered diagrams are stored here under the hash of their DOT source
+DIAGRAM_CACHE_DIR = os.path.join(tempfile.gettempdir(), "github_advisor_diagrams")
+
+# Backticks and curly quotes the model sometimes emits, mapped to plain double quotes
+_DOT_CLEAN = str.maketrans({'`': '"', '\u2018': '"', '\u2019': '"'})
+# Markdown code fence wrapped around the DOT code
+_CODE_FENCE_RE = re.compile(r'^```[a-zA-Z]*\n|\n```$')
+
+# DOT code generated per (name, description, language)
+_DOT_CACHE = TTLCache(maxsize=256, ttl=86400)
+
+SYSTEM_DIAGRAM_PROMPT = """You are a software architect. Create a class diagram in valid DOT notation.
+
+Rules:
+- Use only valid DOT syntax
+- Use double quotes for labels, never backticks
+- Keep class names simple (no special characters)
+- Focus on main classes and relationships
+- Use -> for relationships
+- Example format:
+
+digraph ClassDiagram {
+    rankdir=TB;
+    node [shape=record];
+    
+    ClassA [label="ClassA|+method1()|+method2()"];
+    ClassB [label="ClassB|+method3()"];
+    ClassA -> ClassB;
+}
+
+Return ONLY valid DOT code, no explanations or markdown.
+"""
 
 class ClassDiagramGenerator:
     """Generates class diagrams using OpenAI and Graphviz."""
     
     def __init__(self):
-        self.openai_client = ChatOpenAI(
-            model="gpt-4-turbo-preview",
-            temperature=0.1,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        # DOT output is short and bounded, so a smaller, faster model suffices
+        self.openai_client = get_chat_model("gpt-4o-mini", 0.1)
     
-    async def generate_diagram(self, repository_info: Dict[str, Any]) -> Optional[str]:
-        """Generate a class diagram for a repository."""
+    async def generate_diagram(self, repository_info: Dict[str, Any]) -> Optional[bytes]:
+        """Generate a class diagram for a repository as PNG bytes."""
         try:
             # Extract relevant code structure using OpenAI
             dot_code = await self._extract_class_structure(repository_info)
@@ -24,37 +58,29 @@ class ClassDiagramGenerator:
             if not dot_code:
                 return None
             
-            # Generate the diagram
-            diagram_path = self._create_diagram(dot_code)
-            return diagram_path
+            # Render off the event loop so the Graphviz subprocess doesn't block it
+            png_bytes = await asyncio.to_thread(self._create_diagram, dot_code)
+
+            # Only keep DOT code that rendered; after a failure the next try gets a fresh sample
+            if png_bytes is not None:
+                _DOT_CACHE.set(self._dot_cache_key(repository_info), dot_code)
+            return png_bytes
             
         except Exception as e:
             print(f"Error generating class diagram: {e}")
             return None
+
     
+    def _dot_cache_key(self, repo_info: Dict[str, Any]) -> tuple:
+        """Key DOT code on the repository fields the prompt is built from."""
+        return (repo_info.get('name'), repo_info.get('description'), repo_info.get('language'))
+
     async def _extract_class_structure(self, repo_info: Dict[str, Any]) -> str:
         """Use OpenAI to analyze repository and generate DOT notation."""
-        system_prompt = """You are a software architect. Create a class diagram in valid DOT notation.
+        cached = _DOT_CACHE.get(self._dot_cache_key(repo_info))
+        if cached is not None:
+            return cached
 
-        Rules:
-        - Use only valid DOT syntax
-        - Use double quotes for labels, never backticks
-        - Keep class names simple (no special characters)
-        - Focus on main classes and relationships
-        - Use -> for relationships
-        - Example format:
-        
-        digraph ClassDiagram {
-            rankdir=TB;
-            node [shape=record];
-            
-            ClassA [label="ClassA|+method1()|+method2()"];
-            ClassB [label="ClassB|+method3()"];
-            ClassA -> ClassB;
-        }
-        
-        Return ONLY valid DOT code, no explanations or markdown."""
-        
         user_prompt = f"""Repository: {repo_info.get('name', 'Unknown')}
         Description: {repo_info.get('description', 'No description')}
         Language: {repo_info.get('language', 'Unknown')}
@@ -62,48 +88,47 @@ class ClassDiagramGenerator:
         Create a class diagram in DOT notation for this repository's likely architecture."""
         
         messages = [
-            SystemMessage(content=system_prompt),
+            SystemMessage(content=SYSTEM_DIAGRAM_PROMPT),
             HumanMessage(content=user_prompt)
         ]
         
         response = await self.openai_client.ainvoke(messages)
         return response.content.strip()
     
-    def _create_diagram(self, dot_code: str) -> str:
-        """Create diagram file from DOT code."""
+    def _create_diagram(self, dot_code: str) -> Optional[bytes]:
+        """Render DOT code to PNG bytes."""
         # Clean DOT code - remove markdown formatting and fix syntax
         dot_code = dot_code.strip()
         
         # Remove markdown code blocks
-        if dot_code.startswith('```'):
-            lines = dot_code.split('\n')
-            dot_code = '\n'.join(lines[1:-1]) if len(lines) > 2 else dot_code
+        dot_code = _CODE_FENCE_RE.sub('', dot_code)
         
-        # Remove backticks and other problematic characters
-        dot_code = dot_code.replace('`', '"').replace(''', '"').replace(''', '"')
+        # Replace backticks and other problematic characters in a single pass
+        dot_code = dot_code.translate(_DOT_CLEAN)
         
         # Ensure proper DOT structure
         if not dot_code.startswith('digraph') and not dot_code.startswith('graph'):
             dot_code = f"digraph ClassDiagram {{\n{dot_code}\n}}"
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.dot', delete=False) as f:
-            f.write(dot_code)
-            dot_file = f.name
+        # Rendering is deterministic, so reuse a previous render of the same DOT code
+        key = hashlib.blake2b(dot_code.encode(), digest_size=16).hexdigest()
+        cache_path = os.path.join(DIAGRAM_CACHE_DIR, f"{key}.png")
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                return f.read()
         
         try:
-            # Generate PNG
-            graph = graphviz.Source.from_file(dot_file)
-            output_path = dot_file.replace('.dot', '.png')
-            graph.render(output_path.replace('.png', ''), format='png', cleanup=True)
-            
-            # Clean up dot file
-            os.unlink(dot_file)
-            
-            return output_path
-            
+            # Render the PNG in memory, straight from the DOT source
+            png_bytes = graphviz.Source(dot_code).pipe(format='png')
         except Exception as e:
             print(f"Error creating diagram: {e}")
-            if os.path.exists(dot_file):
-                os.unlink(dot_file)
             return None
+        
+        # Write to a temporary file and rename it into place, so a concurrent render of
+        # the same key never reads a half-written PNG
+        os.makedirs(DIAGRAM_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=DIAGRAM_CACHE_DIR, suffix='.tmp', delete=False) as f:
+            f.write(png_bytes)
+        os.replace(f.name, cache_path)
+        
+        return png_bytes
@@ -1,32 +1,134 @@
-import os
-import json
+import re
+import uuid
+import heapq
+import hashlib
 import asyncio
-from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, AsyncIterator
+from datetime import datetime, timedelta, timezone
 import httpx
+import ciso8601
+import numpy as np
 from langgraph.graph import Graph, END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.aiosqlite import AsyncSqliteSaver
 from langchain.schema import HumanMessage, SystemMessage
+from langchain_core.pydantic_v1 import BaseModel, Field
 from src.github_api import GitHubAPI
 from src.repository_analyzer import RepositoryAnalyzer
 from src.class_diagram_generator import ClassDiagramGenerator
+from src.llm import get_chat_model
+from src.cache import TTLCache, connect_sqlite
+from config import RATE_LIMIT_SETTINGS, CHECKPOINT_SETTINGS
+
+# System prompts are kept byte-identical across calls so the provider's
+# prompt prefix cache can be reused; per-turn data goes in the human message
+SYSTEM_PARSE_PROMPT = """You are an expert at understanding developer needs and converting them into GitHub search terms.
+
+Given a user query about finding a repository, extract:
+1. Primary technology/framework keywords
+2. Programming language preferences
+3. Specific features or use cases
+4. Project type (library, framework, tool, etc.)
+
+Return a JSON object with:
+- "search_terms": list of relevant keywords for GitHub search
+- "language": preferred programming language (if mentioned)
+- "requirements": list of specific requirements mentioned
+
+Example:
+User: "I need a Python web framework for building REST APIs"
+Response: {
+    "search_terms": ["web framework", "REST API", "HTTP", "server"],
+    "language": "python",
+    "requirements": ["REST API support", "web framework"]
+}
+"""
+
+SYSTEM_RESPONSE_PROMPT = """You are a helpful assistant that explains GitHub repository recommendations.
+
+Given a list of repositories with their metrics, provide a conversational explanation of:
+1. Why these repositories are good matches
+2. Key strengths of the top recommendation
+3. Brief comparison of the top options
+
+Be enthusiastic but informative. Focus on the metrics that matter most to developers.
+"""
+
+class ParseResult(BaseModel):
+    """Search parameters extracted from a user query."""
+
+    search_terms: List[str] = Field(description="Relevant keywords for GitHub search")
+    language: Optional[str] = Field(default=None, description="Preferred programming language, if mentioned")
+    requirements: List[str] = Field(default_factory=list, description="Specific requirements mentioned")
+
+# Fewer candidates than this after the combined and speculative searches triggers the
+# per-term fallback, which stops once it is reached (the pool itself can be larger)
+MIN_CANDIDATES_BEFORE_FALLBACK = 30
+# Candidates (by pre-score) that get the full per-repository analysis
+MAX_ANALYZED_REPOSITORIES = 10
+# Repositories presented to the user
+TOP_RECOMMENDATIONS = 3
+# Most a repository can gain from analysis: contributors (500) plus PR merge time (200)
+MAX_ANALYSIS_SCORE = 700
+# GitHub allows at most five boolean operators per search query
+MAX_OR_TERMS = 6
+# Page size of the combined OR search, large enough to usually make the
+# per-term fallback unnecessary
+COMBINED_SEARCH_PER_PAGE = 50
+
+# Score tables: a value scores the entry at its position among the thresholds.
+# Recency and merge time bins are inclusive of the upper threshold ("<= 7 days"),
+# the issue-to-star ratio bins exclusive ("< 0.1")
+_UPDATE_THRESHOLDS = np.array([7, 30, 90])
+_UPDATE_SCORES = np.array([300, 200, 100, 0])
+_MERGE_THRESHOLDS = np.array([1, 3, 7, 14])
+_MERGE_SCORES = np.array([200, 150, 100, 50, 0])
+_ISSUE_RATIO_THRESHOLDS = np.array([0.1, 0.2])
+_ISSUE_RATIO_SCORES = np.array([100, 50, 0])
+
+# Queries asking for a class diagram of a stored repository ("diagrams", "drawing"
+# and so on match too, as with the previous substring check)
+_DIAGRAM_RE = re.compile(r"\b(?:diagram|draw|show|visualize)", re.IGNORECASE)
+# Which stored repository a diagram request refers to; group 1 is the second, group 2 the third
+_REPO_INDEX_RE = re.compile(r"\b(?:(second|2nd|2)|(third|3rd|3))\b", re.IGNORECASE)
+
+# Filler words dropped when turning a raw query into a speculative search
+_STOPWORDS = frozenset("""
+a an and any are best can find for good i i'm im in is it looking me my need of on
+or please recommend show some something that the to use want which with
+""".split())
+# Maximum number of keywords in a speculative search
+MAX_SPECULATIVE_KEYWORDS = 4
+
+# Parsed queries shared across agent instances, keyed on a hash of the normalized
+# query and conversation history
+_PARSE_CACHE = TTLCache(maxsize=512, ttl=3600)
 
 class GitHubRepositoryAgent:
     """Main agent that orchestrates the repository finding workflow using LangGraph."""
 
     def __init__(self):
-        self.openai_client = ChatOpenAI(
-            model="gpt-4-turbo-preview",
-            temperature=0.1,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
+        self.openai_client = get_chat_model("gpt-4-turbo-preview", 0.1)
+        # Schema-constrained parsing doesn't need the premium model
+        self.parser_llm = get_chat_model("gpt-4o-mini", 0)
+        self.query_parser = self.parser_llm.with_structured_output(ParseResult)
         self.github_api = GitHubAPI()
         self.analyzer = RepositoryAnalyzer(self.github_api)
         self.diagram_generator = ClassDiagramGenerator()
-        self.memory = MemorySaver()
+        # In-flight speculative searches, keyed by the run_id of their workflow run
+        self._speculative_searches: Dict[str, asyncio.Future] = {}
+        # Checkpoints live on disk rather than in the process heap; the connection
+        # opens on first use, inside the event loop that runs the workflow
+        self.memory = AsyncSqliteSaver(conn=connect_sqlite(CHECKPOINT_SETTINGS["path"]))
+        # The saver's own setup isn't safe to run concurrently, so runs go through a lock
+        self._checkpoint_lock = asyncio.Lock()
         self.workflow = self._build_workflow()
 
+    async def aclose(self) -> None:
+        """Release the agent's pooled HTTP connections and the checkpoint database."""
+        await self.github_api.aclose()
+        if self.memory.is_setup:
+            await self.memory.conn.close()
+
     def _build_workflow(self) -> Graph:
         """Build the LangGraph workflow for repository finding."""
         workflow = Graph()
@@ -65,24 +167,17 @@ class GitHubRepositoryAgent:
 
     def _route_request(self, state: Dict[str, Any]) -> str:
         """Route request based on query type."""
-        query = state["user_query"].lower()
-        diagram_keywords = ["diagram", "draw", "show", "visualize"]
-        
-        if any(keyword in query for keyword in diagram_keywords):
-            return "diagram"
-        return "search"
+        if state.get("is_diagram") is None:
+            state["is_diagram"] = bool(_DIAGRAM_RE.search(state["user_query"]))
+        return "diagram" if state["is_diagram"] else "search"
 
     async def _generate_diagram(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Generate class diagram for specified repository."""
-        # Parse repo index from query
-        query = state["user_query"].lower()
-        repo_index = 0  # default to first repo
-        
-        if "second" in query or "2nd" in query or "2" in query:
-            repo_index = 1
-        elif "third" in query or "3rd" in query or "3" in query:
-            repo_index = 2
-            
+        # Parse repo index from query, defaulting to the first repo
+        match = _REPO_INDEX_RE.search(state["user_query"])
+        repo_index = match.lastindex if match else 0
+
+
         # Get repositories from state
         repositories = state.get("ranked_repositories", [])
         
@@ -92,21 +187,24 @@ class GitHubRepositoryAgent:
             
         # Generate diagram for selected repository
         selected_repo = repositories[repo_index]
-        diagram_path = await self.diagram_generator.generate_diagram(selected_repo)
+        diagram = await self.diagram_generator.generate_diagram(selected_repo)
         
-        if diagram_path:
-            state["diagram_path"] = diagram_path
+        if diagram:
+            state["diagram"] = diagram
             state["response"] = f"Generated class diagram for {selected_repo['name']}"
         else:
             state["response"] = f"Failed to generate diagram for {selected_repo['name']}"
             
         return state
 
-    async def find_repositories(self, user_query: str, thread_id: str = "default", stored_repositories: List[Dict] = None) -> Dict[str, Any]:
-        """Main entry point for finding repositories."""
-        initial_state = {
+    def _initial_state(self, user_query: str, thread_id: str, stored_repositories: Optional[List[Dict]], history: str) -> Dict[str, Any]:
+        """Build the initial workflow state for a user query."""
+        return {
             "user_query": user_query,
             "thread_id": thread_id,
+            "run_id": uuid.uuid4().hex,
+            "is_diagram": bool(_DIAGRAM_RE.search(user_query)),
+            "history": history,
             "search_terms": [],
             "repositories": [],
             "analyzed_repositories": [],
@@ -114,103 +212,239 @@ class GitHubRepositoryAgent:
             "response": ""
         }
 
-        config = {"configurable": {"thread_id": thread_id}}
-        result = await self.workflow.ainvoke(initial_state, config=config)
-        
-        return {
-            "message": result["response"],
-            "repositories": result.get("ranked_repositories", []),
-            "diagram_path": result.get("diagram_path")
-        }
+    async def find_repositories(self, user_query: str, thread_id: str = "default", stored_repositories: List[Dict] = None, history: str = "") -> AsyncIterator[Dict[str, Any]]:
+        """Main entry point for finding repositories.
+
+        Yields {"delta": text} events as the response is generated, followed by a
+        final {"result": {"message", "repositories", "diagram"}} event.
+        ``history`` is the rendered (and summarized) conversation so far, if any.
+        """
+        initial_state = self._initial_state(user_query, thread_id, stored_repositories, history)
+        result = await self._run_workflow(initial_state)
+
+        messages = result.get("response_messages")
+        if messages:
+            chunks = []
+            async for chunk in self.openai_client.astream(messages):
+                chunks.append(chunk.content)
+                yield {"delta": chunk.content}
+            result["response"] = "".join(chunks)
+        else:
+            yield {"delta": result["response"]}
 
-    async def _parse_query(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Parse user query to extract search terms and requirements."""
-        system_message = SystemMessage(content="""
-        You are an expert at understanding developer needs and converting them into GitHub search terms.
-
-        Given a user query about finding a repository, extract:
-        1. Primary technology/framework keywords
-        2. Programming language preferences
-        3. Specific features or use cases
-        4. Project type (library, framework, tool, etc.)
-
-        Return a JSON object with:
-        - "search_terms": list of relevant keywords for GitHub search
-        - "language": preferred programming language (if mentioned)
-        - "requirements": list of specific requirements mentioned
-
-        Example:
-        User: "I need a Python web framework for building REST APIs"
-        Response: {
-            "search_terms": ["web framework", "REST API", "HTTP", "server"],
-            "language": "python",
-            "requirements": ["REST API support", "web framework"]
+        yield {
+            "result": {
+                "message": result["response"],
+                "repositories": result.get("ranked_repositories", []),
+                "diagram": result.get("diagram")
+            }
         }
-        """)
 
-        human_message = HumanMessage(content=f"User query: {state['user_query']}")
-        response = await self.openai_client.ainvoke([system_message, human_message])
+    async def find_repositories_blocking(self, user_query: str, thread_id: str = "default", stored_repositories: List[Dict] = None, history: str = "") -> Dict[str, Any]:
+        """Find repositories and return the final result once the response is complete."""
+        async for event in self.find_repositories(user_query, thread_id, stored_repositories, history):
+            if "result" in event:
+                return event["result"]
 
+    async def _run_workflow(self, initial_state: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the workflow, overlapping a speculative search with the parse step."""
+        self._start_speculative_search(initial_state)
+        config = {"configurable": {"thread_id": initial_state["thread_id"]}}
         try:
-            parsed_data = json.loads(response.content)
-            state["search_terms"] = parsed_data.get("search_terms", [])
-            state["language"] = parsed_data.get("language")
-            state["requirements"] = parsed_data.get("requirements", [])
-        except json.JSONDecodeError:
-            # Fallback: use the query as-is
-            state["search_terms"] = [state["user_query"]]
-            state["language"] = None
-            state["requirements"] = []
+            async with self._checkpoint_lock:
+                await self.memory.setup()
+            return await self.workflow.ainvoke(initial_state, config=config)
+        finally:
+            speculative = self._speculative_searches.pop(initial_state["run_id"], None)
+            if speculative is not None:
+                speculative.cancel()
+
+    def _start_speculative_search(self, state: Dict[str, Any]) -> None:
+        """Search for the raw query's keywords while the LLM is still parsing it."""
+        if self._route_request(state) == "diagram":
+            return
+
+        words = re.findall(r"[\w+#.'-]+", state["user_query"].lower())
+        keywords = [word for word in words if word not in _STOPWORDS][:MAX_SPECULATIVE_KEYWORDS]
+        if not keywords:
+            return
+
+        self._speculative_searches[state["run_id"]] = asyncio.ensure_future(
+            self._search(" ".join(keywords), "stars", "desc", 20)
+        )
 
-        return state
+    def _with_history(self, state: Dict[str, Any], content: str) -> str:
+        """Prefix a human message with the conversation so far, if there is any."""
+        if not state.get("history"):
+            return content
+        return f"Conversation so far:\n{state['history']}\n\n{content}"
 
-    async def _search_repositories(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Search GitHub for repositories based on parsed terms."""
-        repositories = []
+    async def _parse_query(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse user query to extract search terms and requirements."""
+        # Diagram requests work on the stored repositories and never use search terms
+        if self._route_request(state) == "diagram":
+            return state
 
-        for term in state["search_terms"]:
-            search_query = term
-            if state.get("language"):
-                search_query += f" language:{state['language']}"
+        normalized_query = re.sub(r"\s+", " ", state["user_query"].strip().lower())
+        cache_key = hashlib.blake2b(
+            f"{normalized_query}\0{state.get('history', '')}".encode(),
+            digest_size=16
+        ).hexdigest()
+        cached = _PARSE_CACHE.get(cache_key)
+        if cached is not None:
+            state["search_terms"], state["language"], state["requirements"] = cached
+            return state
 
-            results = await self.github_api.search_repositories(
-                query=search_query,
-                sort="stars",
-                order="desc",
-                per_page=20
-            )
+        system_message = SystemMessage(content=SYSTEM_PARSE_PROMPT)
 
-            repositories.extend(results.get("items", []))
+        human_message = HumanMessage(content=self._with_history(state, f"User query: {state['user_query']}"))
+        parsed = await self.query_parser.ainvoke([system_message, human_message])
 
-        # Remove duplicates based on repository ID
+        state["search_terms"] = parsed.search_terms
+        state["language"] = parsed.language
+        state["requirements"] = parsed.requirements
+        _PARSE_CACHE.set(cache_key, (
+            state["search_terms"],
+            state["language"],
+            state["requirements"]
+        ))
+
+        return state
+
+    async def _search_repositories(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Search GitHub for repositories based on parsed terms."""
+        terms = self._dedupe_search_terms(state["search_terms"])
+        qualifier = f" language:{state['language']}" if state.get("language") else ""
         unique_repos = {}
-        for repo in repositories:
-            unique_repos[repo["id"]] = repo
 
-        state["repositories"] = list(unique_repos.values())[:30]  # Limit to top 30
+        # GitHub search supports OR, so try covering every term in one request
+        if len(terms) > 1:
+            combined = " OR ".join(f'"{term}"' for term in terms[:MAX_OR_TERMS])
+            try:
+                for repo in await self._search(combined + qualifier, "stars", "desc", COMBINED_SEARCH_PER_PAGE):
+                    unique_repos[repo["id"]] = repo
+            except Exception:
+                pass
+
+        # Merge the speculative search started alongside the parse step
+        speculative = self._speculative_searches.pop(state.get("run_id"), None)
+        if speculative is not None:
+            try:
+                items = await speculative
+            except Exception:
+                items = []
+            language = (state.get("language") or "").lower()
+            for repo in items:
+                # The speculative search ran without the parsed language filter
+                if not language or (repo.get("language") or "").lower() == language:
+                    unique_repos.setdefault(repo["id"], repo)
+
+        # Fall back to concurrent per-term searches, stopping once we have enough
+        if len(unique_repos) < MIN_CANDIDATES_BEFORE_FALLBACK:
+            tasks = [
+                asyncio.ensure_future(self._search(term + qualifier, "stars", "desc", 20))
+                for term in terms
+            ]
+            try:
+                for future in asyncio.as_completed(tasks):
+                    try:
+                        items = await future
+                    except Exception:
+                        continue
+                    for repo in items:
+                        unique_repos[repo["id"]] = repo
+                    if len(unique_repos) >= MIN_CANDIDATES_BEFORE_FALLBACK:
+                        break
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        # Only the strongest candidates are worth the expensive per-repository analysis
+        candidates = list(unique_repos.values())
+        order = np.argsort(-self._pre_score_repositories(candidates, datetime.now(timezone.utc)), kind="stable")
+        state["repositories"] = [candidates[i] for i in order[:MAX_ANALYZED_REPOSITORIES]]
         return state
 
+    def _pre_score_repositories(self, repositories: List[Dict[str, Any]], now: datetime) -> np.ndarray:
+        """Score search results on the signals they already carry (stars, recency, issues)."""
+        return self._calculate_repository_scores([
+            {
+                "stars": repo.get("stargazers_count", 0),
+                "last_updated_days": (
+                    now - ciso8601.parse_datetime(repo["updated_at"])
+                ).days if repo.get("updated_at") else 365,
+                "open_issues": repo.get("open_issues_count", 0)
+            }
+            for repo in repositories
+        ])
+
+    def _dedupe_search_terms(self, search_terms: List[str]) -> List[str]:
+        """Normalize search terms and drop duplicates and terms covered by a more specific one."""
+        terms = []
+        for term in search_terms:
+            term = term.strip().lower()
+            if term and term not in terms:
+                terms.append(term)
+
+        # "api" adds nothing once "rest api" is searched; compare whole words so
+        # "go" isn't dropped for "django" or "ai" for "email"
+        words = [set(term.split()) for term in terms]
+        return [
+            term for term, term_words in zip(terms, words)
+            if not any(term_words < other_words for other_words in words)
+        ]
+
+    async def _search(self, query: str, sort: str, order: str, per_page: int) -> List[Dict[str, Any]]:
+        """Search repositories and return the result items."""
+        results = await self.github_api.search_repositories(
+            query=query,
+            sort=sort,
+            order=order,
+            per_page=per_page
+        )
+        return results.get("items", [])
+
     async def _analyze_repositories(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze repositories for detailed metrics."""
-        analyzed_repos = []
-
-        # Process repositories in batches to avoid rate limits
-        batch_size = 5
-        repositories = state["repositories"]
+        # Requests are paced per token by GitHubAPI; this only caps how many analyses run at once
+        semaphore = asyncio.Semaphore(RATE_LIMIT_SETTINGS["max_concurrent"])
+        # One clock reading for the whole batch keeps "days since" figures consistent
+        now = datetime.now(timezone.utc)
 
-        for i in range(0, len(repositories), batch_size):
-            batch = repositories[i:i + batch_size]
-            batch_results = await asyncio.gather(*[
-                self.analyzer.analyze_repository(repo)
-                for repo in batch
-            ], return_exceptions=True)
+        async def run(repo: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await self.analyzer.analyze_repository(repo, now=now)
 
-            for result in batch_results:
-                if not isinstance(result, Exception) and result:
-                    analyzed_repos.append(result)
+        # A repository's pre-score plus the most analysis can add bounds its final score;
+        # once the top recommendations are confirmed above a bound, that analysis is moot
+        repositories = state["repositories"]
+        upper_bounds = self._pre_score_repositories(repositories, now) + MAX_ANALYSIS_SCORE
+        tasks = {
+            asyncio.ensure_future(run(repo)): float(bound)
+            for repo, bound in zip(repositories, upper_bounds)
+        }
+        pending = set(tasks)
+        analyzed_repos = []
+        best_scores = []  # Min-heap of the top confirmed scores
 
-            # Small delay to be respectful to the API
-            await asyncio.sleep(0.5)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None or not task.result():
+                        continue
+                    analyzed_repos.append(task.result())
+                    heapq.heappush(best_scores, float(self._calculate_repository_scores([task.result()])[0]))
+                    if len(best_scores) > TOP_RECOMMENDATIONS:
+                        heapq.heappop(best_scores)
+
+                if len(best_scores) == TOP_RECOMMENDATIONS:
+                    for task in [task for task in pending if tasks[task] < best_scores[0]]:
+                        task.cancel()
+                        pending.discard(task)
+        finally:
+            for task in pending:
+                task.cancel()
 
         state["analyzed_repositories"] = analyzed_repos
         return state
@@ -223,68 +457,59 @@ class GitHubRepositoryAgent:
             state["ranked_repositories"] = []
             return state
 
-        # Calculate composite score for each repository
-        for repo in repositories:
-            score = self._calculate_repository_score(repo)
-            repo["composite_score"] = score
+        # Calculate composite scores for all repositories at once
+        scores = self._calculate_repository_scores(repositories)
+        for repo, score in zip(repositories, scores):
+            repo["composite_score"] = float(score)
 
-        # Sort by composite score
-        ranked_repos = sorted(repositories, key=lambda x: x["composite_score"], reverse=True)
-        state["ranked_repositories"] = ranked_repos
+        # Sort by composite score (stable, so ties keep their search order)
+        order = np.argsort(-scores, kind="stable")
+        state["ranked_repositories"] = [repositories[i] for i in order]
         return state
 
-    def _calculate_repository_score(self, repo: Dict[str, Any]) -> float:
-        """Calculate a composite score for repository ranking."""
-        score = 0
+    def _calculate_repository_scores(self, repositories: List[Dict[str, Any]]) -> np.ndarray:
+        """Calculate composite ranking scores for a list of repositories."""
+        n = len(repositories)
+        stars = np.fromiter((repo.get("stars", 0) for repo in repositories), dtype=float, count=n)
+        contributors = np.fromiter((repo.get("contributors", 0) for repo in repositories), dtype=float, count=n)
+        last_updated = np.fromiter((repo.get("last_updated_days", 365) for repo in repositories), dtype=float, count=n)
+        merge_times = np.fromiter((
+            np.nan if repo.get("avg_pr_merge_time") is None else repo["avg_pr_merge_time"]
+            for repo in repositories
+        ), dtype=float, count=n)
+        open_issues = np.fromiter((repo.get("open_issues", 0) for repo in repositories), dtype=float, count=n)
 
         # Stars (normalized, max 1000 points)
-        stars = repo.get("stars", 0)
-        score += min(stars / 10, 1000)
+        score = np.minimum(stars / 10, 1000)
 
         # Contributors (normalized, max 500 points)
-        contributors = repo.get("contributors", 0)
-        score += min(contributors * 5, 500)
+        score += np.minimum(contributors * 5, 500)
 
         # Recent activity (max 300 points)
-        last_updated = repo.get("last_updated_days", 365)
-        if last_updated <= 7:
-            score += 300
-        elif last_updated <= 30:
-            score += 200
-        elif last_updated <= 90:
-            score += 100
-
-        # PR merge time (max 200 points, favor faster merges)
-        avg_merge_time = repo.get("avg_pr_merge_time")
-        if avg_merge_time is not None:
-            if avg_merge_time <= 1:
-                score += 200
-            elif avg_merge_time <= 3:
-                score += 150
-            elif avg_merge_time <= 7:
-                score += 100
-            elif avg_merge_time <= 14:
-                score += 50
+        score += _UPDATE_SCORES[np.searchsorted(_UPDATE_THRESHOLDS, last_updated, side="left")]
+
+        # PR merge time (max 200 points, favor faster merges; unknown scores 0)
+        score += _MERGE_SCORES[
+            np.searchsorted(_MERGE_THRESHOLDS, np.nan_to_num(merge_times, nan=np.inf), side="left")
+        ]
 
         # Issues to stars ratio (max 100 points, lower is better)
-        open_issues = repo.get("open_issues", 0)
-        if stars > 0:
-            issue_ratio = open_issues / stars
-            if issue_ratio < 0.1:
-                score += 100
-            elif issue_ratio < 0.2:
-                score += 50
+        issue_ratio = np.where(stars > 0, open_issues / np.maximum(stars, 1), np.inf)
+        score += _ISSUE_RATIO_SCORES[np.searchsorted(_ISSUE_RATIO_THRESHOLDS, issue_ratio, side="right")]
 
         return score
 
     async def _generate_response(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Generate a natural language response about the found repositories."""
-        
+        # Only the top recommendations (for follow-up diagram requests) and the response
+        # need to outlive the run, so drop the bulky intermediate results before the
+        # final state is checkpointed
+        state.pop("repositories", None)
+        state.pop("analyzed_repositories", None)
+        state["ranked_repositories"] = state.get("ranked_repositories", [])[:TOP_RECOMMENDATIONS]
+
         # Check if this is a diagram request - provide minimal response
-        query = state["user_query"].lower()
-        diagram_keywords = ["diagram", "draw", "show", "visualize"]
-        
-        if any(keyword in query for keyword in diagram_keywords):
+        if self._route_request(state) == "diagram":
             # Use the response already set by _generate_diagram
             if "response" in state and state["response"]:
                 return state
@@ -293,22 +518,13 @@ class GitHubRepositoryAgent:
                 return state
         
         # Regular search response
-        repositories = state["ranked_repositories"][:3]  # Top 3
+        repositories = state["ranked_repositories"][:TOP_RECOMMENDATIONS]
 
         if not repositories:
             state["response"] = "I couldn't find any repositories matching your criteria. Try refining your search terms."
             return state
 
-        system_message = SystemMessage(content="""
-        You are a helpful assistant that explains GitHub repository recommendations.
-
-        Given a list of repositories with their metrics, provide a conversational explanation of:
-        1. Why these repositories are good matches
-        2. Key strengths of the top recommendation
-        3. Brief comparison of the top options
-
-        Be enthusiastic but informative. Focus on the metrics that matter most to developers.
-        """)
+        system_message = SystemMessage(content=SYSTEM_RESPONSE_PROMPT)
 
         repo_summary = []
         for i, repo in enumerate(repositories):
@@ -323,15 +539,16 @@ class GitHubRepositoryAgent:
             """
             repo_summary.append(summary)
 
-        human_message = HumanMessage(content=f"""
+        human_message = HumanMessage(content=self._with_history(state, f"""
         User was looking for: {state['user_query']}
 
         Top repositories found:
         {chr(10).join(repo_summary)}
 
         Please provide a conversational explanation of these recommendations.
-        """)
+        """))
 
-        response = await self.openai_client.ainvoke([system_message, human_message])
-        state["response"] = response.content
+        # A graph node can't yield, so find_repositories runs the completion itself
+        # once the workflow finishes and forwards the tokens as they arrive
+        state["response_messages"] = [system_message, human_message]
         return state
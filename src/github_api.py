@@ -1,21 +1,260 @@
 import os
+import time
 import asyncio
+import hashlib
+from urllib.parse import urlencode, urlparse, parse_qs
 from typing import Dict, List, Any, Optional
 import httpx
+import orjson
 from datetime import datetime
+from src.cache import CachedResponse, ResponseCache
+from config import RATE_LIMIT_SETTINGS, CACHE_SETTINGS
 
 class GitHubAPI:
     """GitHub REST API client with async support."""
 
     def __init__(self):
         self.base_url = "https://api.github.com"
-        self.token = os.getenv("GITHUB_TOKEN")
+        # GITHUB_TOKENS is a comma-separated pool; a single GITHUB_TOKEN still works
+        tokens = os.getenv("GITHUB_TOKENS") or os.getenv("GITHUB_TOKEN") or ""
+        self.tokens = [token.strip() for token in tokens.split(",") if token.strip()]
         self.headers = {
             "Accept": "application/vnd.github+json",
             "X-GitHub-Api-Version": "2022-11-28"
         }
-        if self.token:
-            self.headers["Authorization"] = f"Bearer {self.token}"
+        # One long-lived client so connections (and HTTP/2 streams) are reused
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=15.0
+            )
+        )
+        # Caps requests in flight; each token tracks, per rate-limit resource ("core",
+        # "search"), its remaining quota, the earliest time header pacing allows it again,
+        # any Retry-After hold, and how many of its requests are currently outstanding.
+        # Authorization is set per request, so an unauthenticated client is just a
+        # pool with a single None token.
+        self._rate_sem = asyncio.Semaphore(RATE_LIMIT_SETTINGS["max_in_flight"])
+        self._token_state: List[Dict[str, Any]] = [
+            {
+                "token": token,
+                "credential": self._credential(f"Bearer {token}" if token else None),
+                "remaining": {},
+                "next_allowed": {},
+                "retry_until": {},
+                "in_flight": 0
+            }
+            for token in (self.tokens or [None])
+        ]
+        # Responses kept in memory and on disk, revalidated with their ETag once stale
+        self._response_cache = ResponseCache(
+            CACHE_SETTINGS["http_cache_path"],
+            max_bytes=CACHE_SETTINGS["memory_bytes"],
+            max_rows=CACHE_SETTINGS["disk_entries"],
+            max_stale=CACHE_SETTINGS["max_stale"]
+        )
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP client and the response cache."""
+        await self._client.aclose()
+        await self._response_cache.aclose()
+
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """Issue a cached GET request, revalidating stale entries with their ETag.
+
+        Fresh cache hits skip the network entirely; a 304 on revalidation doesn't
+        count against the rate limit.
+        """
+        key = f"{path}?{urlencode(sorted(params.items()))}" if params else path
+        cached = await self._response_cache.get(key)
+        if cached is not None and cached.expires_at > time.time():
+            return self._cached_response(path, cached)
+
+        # ETags are per credential, so revalidate with the token that got this one
+        headers = None
+        credential = None
+        if cached is not None and cached.etag:
+            headers = {"If-None-Match": cached.etag}
+            credential = cached.credential
+        response = await self._request("GET", path, params=params, headers=headers, credential=credential)
+
+        ttl = CACHE_SETTINGS["search_ttl"] if path.startswith("/search/") else CACHE_SETTINGS["default_ttl"]
+        if response.status_code == 304 and cached is not None:
+            cached = cached._replace(expires_at=time.time() + ttl)
+            await self._response_cache.set(key, cached)
+            return self._cached_response(path, cached)
+
+        if response.status_code == 200:
+            await self._response_cache.set(key, CachedResponse(
+                response.headers.get("ETag"),
+                response.content,
+                time.time() + ttl,
+                self._credential(response.request.headers.get("Authorization")),
+                response.headers.get("Link")
+            ))
+        return response
+
+    @staticmethod
+    def _credential(authorization: Optional[str]) -> Optional[str]:
+        """Identify the credential behind an Authorization header without storing it."""
+        if not authorization:
+            return None
+        return hashlib.blake2b(authorization.encode(), digest_size=16).hexdigest()
+
+    def _cached_response(self, path: str, cached: CachedResponse) -> httpx.Response:
+        """Build a 200 response carrying a cached body (and its pagination links)."""
+        headers = {"Link": cached.link} if cached.link else None
+        return httpx.Response(
+            200,
+            headers=headers,
+            content=cached.body,
+            request=self._client.build_request("GET", path)
+        )
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        credential: Optional[str] = None,
+        **kwargs: Any
+    ) -> httpx.Response:
+        """Issue a request, pacing on rate-limit headers and retrying when throttled.
+
+        ``credential`` asks for a specific pooled token, if it is usable right now.
+        """
+        if path.startswith("/search/"):
+            resource = "search"
+        elif path == "/graphql":
+            resource = "graphql"
+        else:
+            resource = "core"
+        max_retries = RATE_LIMIT_SETTINGS["max_retries"]
+
+        headers = kwargs.pop("headers", None) or {}
+
+        # Pacing and backoff sleeps happen outside the semaphore, so a throttled resource
+        # doesn't hold in-flight slots that requests to other resources could use
+        for attempt in range(max_retries):
+            state = self._pick_token(resource, credential)
+            state["in_flight"] += 1
+            try:
+                delay = self._next_allowed(state, resource) - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                if state["token"]:
+                    headers["Authorization"] = f"Bearer {state['token']}"
+                async with self._rate_sem:
+                    response = await self._client.request(method, path, headers=headers, **kwargs)
+            finally:
+                state["in_flight"] -= 1
+            self._update_pacing(state, resource, response)
+
+            if response.status_code not in (403, 429) or attempt == max_retries - 1:
+                return response
+
+            # A 403 without rate-limit signals is a genuine permission error
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code == 403 and retry_after is None \
+                    and response.headers.get("X-RateLimit-Remaining") != "0":
+                return response
+
+            if retry_after is not None:
+                # Hold back every request to this resource, not just this one
+                # Kept apart from header pacing, which a concurrent healthy response
+                # would otherwise reset before the server's hold is over
+                state["retry_until"][resource] = max(
+                    state["retry_until"].get(resource, 0.0),
+                    time.time() + float(retry_after)
+                )
+            else:
+                await asyncio.sleep(RATE_LIMIT_SETTINGS["backoff_base"] * 2 ** attempt)
+
+        return response
+
+    def _pick_token(self, resource: str, credential: Optional[str] = None) -> Dict[str, Any]:
+        """Pick the token that can be used soonest, preferring the most remaining quota.
+
+        Ties, such as every token before any rate-limit headers have come back, go to
+        the token with the fewest requests in flight. A token asked for by
+        ``credential`` wins if it isn't paced or out of quota.
+        """
+        preferred = [
+            s for s in self._token_state
+            if credential is not None and s["credential"] == credential
+            and self._next_allowed(s, resource) <= time.time()
+            and s["remaining"].get(resource, 1) > 0
+        ]
+        state = preferred[0] if preferred else min(
+            self._token_state,
+            key=lambda s: (
+                self._next_allowed(s, resource),
+                -s["remaining"].get(resource, float("inf")),
+                s["in_flight"]
+            )
+        )
+        # Count the request now so concurrent callers spread over the pool
+        # instead of all picking the same token before its headers come back
+        if resource in state["remaining"]:
+            state["remaining"][resource] -= 1
+        return state
+
+    def _next_allowed(self, state: Dict[str, Any], resource: str) -> float:
+        """Earliest time a token may be used for ``resource``, honouring any Retry-After hold."""
+        return max(state["next_allowed"].get(resource, 0.0), state["retry_until"].get(resource, 0.0))
+
+    def _update_pacing(self, state: Dict[str, Any], resource: str, response: httpx.Response) -> None:
+        """Spread a token's remaining rate-limit budget over the window once it runs low."""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        limit = response.headers.get("X-RateLimit-Limit")
+        if remaining is None or reset is None:
+            return
+
+        remaining = int(remaining)
+        state["remaining"][resource] = remaining
+        threshold = int(limit) * RATE_LIMIT_SETTINGS["pacing_threshold"] if limit else 0
+        if remaining >= threshold:
+            state["next_allowed"][resource] = 0.0
+            return
+
+        now = time.time()
+        interval = (int(reset) - now) / max(remaining, 1)
+        # Don't stall a chat turn for a long window (e.g. the hourly core limit)
+        state["next_allowed"][resource] = now + min(max(interval, 0.0), RATE_LIMIT_SETTINGS["max_reset_wait"])
+
+    async def graphql(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run a GraphQL query and return its data (requires at least one token)."""
+        # Serialized once with sorted keys: the same bytes are the request body and the cache key
+        payload = orjson.dumps({"query": query, "variables": variables or {}}, option=orjson.OPT_SORT_KEYS)
+        # GraphQL has no conditional requests, so results are only cached for their TTL
+        key = "/graphql#" + hashlib.blake2b(payload, digest_size=16).hexdigest()
+        cached = await self._response_cache.get(key)
+        if cached is not None and cached.expires_at > time.time():
+            return orjson.loads(cached.body)["data"]
+
+        response = await self._request(
+            "POST",
+            "/graphql",
+            content=payload,
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        body = orjson.loads(response.content)
+        if body.get("errors") and not body.get("data"):
+            raise RuntimeError(f"GraphQL query failed: {body['errors'][0].get('message')}")
+
+        await self._response_cache.set(key, CachedResponse(
+            None,
+            response.content,
+            time.time() + CACHE_SETTINGS["default_ttl"]
+        ))
+        return body["data"]
 
     async def search_repositories(
         self, 
@@ -25,7 +264,7 @@ class GitHubAPI:
         per_page: int = 30
     ) -> Dict[str, Any]:
         """Search for repositories."""
-        url = f"{self.base_url}/search/repositories"
+        path = "/search/repositories"
         params = {
             "q": query,
             "sort": sort,
@@ -33,31 +272,28 @@ class GitHubAPI:
             "per_page": per_page
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            return response.json()
+        response = await self._get(path, params=params)
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     async def get_repository_details(self, owner: str, repo: str) -> Dict[str, Any]:
         """Get detailed repository information."""
-        url = f"{self.base_url}/repos/{owner}/{repo}"
+        path = f"/repos/{owner}/{repo}"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
+        response = await self._get(path)
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     async def get_contributors(self, owner: str, repo: str, per_page: int = 100) -> List[Dict[str, Any]]:
         """Get repository contributors."""
-        url = f"{self.base_url}/repos/{owner}/{repo}/contributors"
+        path = f"/repos/{owner}/{repo}/contributors"
         params = {"per_page": per_page}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers, params=params)
-            if response.status_code == 204:  # Empty repository
-                return []
-            response.raise_for_status()
-            return response.json()
+        response = await self._get(path, params=params)
+        if response.status_code == 204:  # Empty repository
+            return []
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     async def get_pull_requests(
         self, 
@@ -67,7 +303,7 @@ class GitHubAPI:
         per_page: int = 100
     ) -> List[Dict[str, Any]]:
         """Get repository pull requests."""
-        url = f"{self.base_url}/repos/{owner}/{repo}/pulls"
+        path = f"/repos/{owner}/{repo}/pulls"
         params = {
             "state": state,
             "per_page": per_page,
@@ -75,10 +311,24 @@ class GitHubAPI:
             "direction": "desc"
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            return response.json()
+        response = await self._get(path, params=params)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    async def count_pull_requests(self, owner: str, repo: str, state: str = "open") -> int:
+        """Count repository pull requests from the pagination links of a one-item page."""
+        path = f"/repos/{owner}/{repo}/pulls"
+        params = {
+            "state": state,
+            "per_page": 1
+        }
+
+        response = await self._get(path, params=params)
+        response.raise_for_status()
+        last = response.links.get("last")
+        if last:
+            return int(parse_qs(urlparse(last["url"]).query)["page"][0])
+        return len(orjson.loads(response.content))
 
     async def get_issues(
         self, 
@@ -88,41 +338,38 @@ class GitHubAPI:
         per_page: int = 100
     ) -> List[Dict[str, Any]]:
         """Get repository issues."""
-        url = f"{self.base_url}/repos/{owner}/{repo}/issues"
+        path = f"/repos/{owner}/{repo}/issues"
         params = {
             "state": state,
             "per_page": per_page
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            return response.json()
+        response = await self._get(path, params=params)
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     async def get_releases(self, owner: str, repo: str, per_page: int = 10) -> List[Dict[str, Any]]:
         """Get repository releases."""
-        url = f"{self.base_url}/repos/{owner}/{repo}/releases"
+        path = f"/repos/{owner}/{repo}/releases"
         params = {"per_page": per_page}
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers)
-            if response.status_code == 404:
-                return []
-            response.raise_for_status()
-            return response.json()
+        response = await self._get(path, params=params)
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
     async def get_commit_activity(self, owner: str, repo: str) -> List[Dict[str, Any]]:
         """Get repository commit activity for the last year."""
-        url = f"{self.base_url}/repos/{owner}/{repo}/stats/commit_activity"
+        path = f"/repos/{owner}/{repo}/stats/commit_activity"
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, headers=self.headers)
-            if response.status_code == 202:  # Computing stats
-                await asyncio.sleep(2)
-                response = await client.get(url, headers=self.headers)
+        response = await self._get(path)
+        if response.status_code == 202:  # Computing stats
+            await asyncio.sleep(2)
+            response = await self._get(path)
 
-            if response.status_code == 204:  # Empty repository
-                return []
+        if response.status_code == 204:  # Empty repository
+            return []
 
-            response.raise_for_status()
-            return response.json()
+        response.raise_for_status()
+        return orjson.loads(response.content)
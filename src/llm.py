@@ -0,0 +1,36 @@
+import os
+from typing import Dict, Optional, Tuple
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+
+# One OpenAI client pair per process, shared by every chat model, so all LLM calls
+# reuse the same pooled connections to the API
+_OPENAI_CLIENTS: Optional[Tuple[openai.OpenAI, openai.AsyncOpenAI]] = None
+_CHAT_MODELS: Dict[Tuple[str, float], ChatOpenAI] = {}
+
+def _openai_clients() -> Tuple[openai.OpenAI, openai.AsyncOpenAI]:
+    """Create the shared sync and async OpenAI clients on first use."""
+    global _OPENAI_CLIENTS
+    if _OPENAI_CLIENTS is None:
+        limits = httpx.Limits(max_keepalive_connections=10, keepalive_expiry=30.0)
+        api_key = os.getenv("OPENAI_API_KEY")
+        _OPENAI_CLIENTS = (
+            openai.OpenAI(api_key=api_key, http_client=httpx.Client(limits=limits)),
+            openai.AsyncOpenAI(api_key=api_key, http_client=httpx.AsyncClient(limits=limits))
+        )
+    return _OPENAI_CLIENTS
+
+def get_chat_model(model: str, temperature: float) -> ChatOpenAI:
+    """Return the process-wide chat model for ``model`` at ``temperature``."""
+    key = (model, temperature)
+    if key not in _CHAT_MODELS:
+        client, async_client = _openai_clients()
+        _CHAT_MODELS[key] = ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            client=client.chat.completions,
+            async_client=async_client.chat.completions
+        )
+    return _CHAT_MODELS[key]
@@ -1,41 +1,78 @@
 import asyncio
-from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from bisect import bisect_left
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import ciso8601
 from src.github_api import GitHubAPI
 
+# Everything analyze_repository needs, fetched in a single GraphQL round trip
+REPOSITORY_METRICS_QUERY = """
+query($owner: String!, $name: String!, $monthAgo: GitTimestamp!, $yearAgo: GitTimestamp!) {
+  repository(owner: $owner, name: $name) {
+    mentionableUsers { totalCount }
+    openPullRequests: pullRequests(states: OPEN) { totalCount }
+    closedPullRequests: pullRequests(first: 50, states: [CLOSED, MERGED], orderBy: {field: UPDATED_AT, direction: DESC}) {
+      nodes { createdAt mergedAt }
+    }
+    openIssues: issues(states: OPEN) { totalCount }
+    closedIssues: issues(first: 30, states: CLOSED, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes { createdAt closedAt }
+    }
+    releases(first: 10, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes { tagName publishedAt }
+    }
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          lastMonth: history(since: $monthAgo) { totalCount }
+          lastYear: history(since: $yearAgo) { totalCount }
+        }
+      }
+    }
+  }
+}
+"""
+
+# Commit activity levels for last-month commit counts: <= 10, <= 50, above
+_COMMIT_ACTIVITY_THRESHOLDS = [10, 50]
+_COMMIT_ACTIVITY_LEVELS = ["low", "medium", "high"]
+
+def _parse(timestamp: str) -> datetime:
+    """Parse a GitHub ISO 8601 timestamp (including the "Z" suffix)."""
+    return ciso8601.parse_datetime(timestamp)
+
 class RepositoryAnalyzer:
     """Analyzes GitHub repositories for various metrics and insights."""
 
     def __init__(self, github_api: GitHubAPI):
         self.github_api = github_api
 
-    async def analyze_repository(self, repo_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Analyze a repository and return detailed metrics."""
+    async def analyze_repository(
+        self,
+        repo_data: Dict[str, Any],
+        now: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Analyze a repository and return detailed metrics relative to ``now``."""
+        now = now or datetime.now(timezone.utc)
         try:
             owner = repo_data["owner"]["login"]
             name = repo_data["name"]
 
-            # Get additional data in parallel
-            tasks = [
-                self._get_contributor_count(owner, name),
-                self._analyze_pull_requests(owner, name),
-                self._analyze_issues(owner, name),
-                self._get_release_info(owner, name),
-                self._analyze_commit_activity(owner, name)
-            ]
-
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            # GraphQL needs a token; without one (or if it fails) use the REST endpoints
+            metrics = None
+            if self.github_api.tokens:
+                try:
+                    metrics = await self._collect_graphql_metrics(owner, name, now)
+                except Exception as e:
+                    print(f"GraphQL analysis failed for {owner}/{name}, falling back to REST: {str(e)}")
+            if metrics is None:
+                metrics = await self._collect_rest_metrics(owner, name, now, repo_data["open_issues_count"])
 
-            # Extract results (handling exceptions)
-            contributor_count = results[0] if not isinstance(results[0], Exception) else 0
-            pr_metrics = results[1] if not isinstance(results[1], Exception) else {}
-            issue_metrics = results[2] if not isinstance(results[2], Exception) else {}
-            release_info = results[3] if not isinstance(results[3], Exception) else {}
-            activity_metrics = results[4] if not isinstance(results[4], Exception) else {}
+            contributor_count, pr_metrics, issue_metrics, release_info, activity_metrics = metrics
 
             # Calculate days since last update
-            updated_at = datetime.fromisoformat(repo_data["updated_at"].replace("Z", "+00:00"))
-            days_since_update = (datetime.now(updated_at.tzinfo) - updated_at).days
+            updated_at = _parse(repo_data["updated_at"])
+            days_since_update = (now - updated_at).days
 
             return {
                 "id": repo_data["id"],
@@ -69,6 +106,82 @@ class RepositoryAnalyzer:
             print(f"Error analyzing repository {repo_data.get('full_name', 'unknown')}: {str(e)}")
             return None
 
+    async def _collect_graphql_metrics(
+        self,
+        owner: str,
+        name: str,
+        now: datetime
+    ) -> Tuple[int, Dict, Dict, Dict, Dict]:
+        """Fetch all repository metrics with one GraphQL query."""
+        # Day granularity keeps the variables, and so the cached result, stable within a day
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        data = await self.github_api.graphql(REPOSITORY_METRICS_QUERY, {
+            "owner": owner,
+            "name": name,
+            "monthAgo": (today - timedelta(weeks=4)).isoformat(),
+            "yearAgo": (today - timedelta(weeks=52)).isoformat()
+        })
+        repository = data["repository"]
+
+        # Reshape nodes to the REST field names the summarizers work on
+        closed_prs = [
+            {"created_at": pr["createdAt"], "merged_at": pr["mergedAt"]}
+            for pr in repository["closedPullRequests"]["nodes"]
+        ]
+        closed_issues = [
+            {"created_at": issue["createdAt"], "closed_at": issue["closedAt"]}
+            for issue in repository["closedIssues"]["nodes"]
+        ]
+        releases = [
+            {"tag_name": release["tagName"], "published_at": release["publishedAt"]}
+            for release in repository["releases"]["nodes"]
+        ]
+        commit_target = (repository.get("defaultBranchRef") or {}).get("target") or {}
+        commits_last_month = commit_target.get("lastMonth", {}).get("totalCount", 0)
+        commits_last_year = commit_target.get("lastYear", {}).get("totalCount", 0)
+
+        return (
+            repository["mentionableUsers"]["totalCount"],
+            self._summarize_pull_requests(repository["openPullRequests"]["totalCount"], closed_prs),
+            self._summarize_issues(repository["openIssues"]["totalCount"], closed_issues),
+            self._summarize_releases(releases, now),
+            self._summarize_commit_activity(commits_last_month, commits_last_year)
+        )
+
+    async def _collect_rest_metrics(
+        self,
+        owner: str,
+        name: str,
+        now: datetime,
+        open_issues_count: int
+    ) -> Tuple[int, Dict, Dict, Dict, Dict]:
+        """Fetch repository metrics from the individual REST endpoints in parallel."""
+        tasks = [
+            self._get_contributor_count(owner, name),
+            self._analyze_pull_requests(owner, name),
+            self._get_closed_issues(owner, name),
+            self._get_release_info(owner, name, now),
+            self._analyze_commit_activity(owner, name)
+        ]
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Extract results (handling exceptions)
+        contributor_count = results[0] if not isinstance(results[0], Exception) else 0
+        pr_metrics = results[1] if not isinstance(results[1], Exception) else {}
+        release_info = results[3] if not isinstance(results[3], Exception) else {}
+        activity_metrics = results[4] if not isinstance(results[4], Exception) else {}
+
+        # The repository's open_issues_count includes open PRs, so subtract them
+        # rather than downloading the open issues just to count them
+        if isinstance(results[2], Exception):
+            issue_metrics = {"open_issues_actual": 0, "avg_issue_close_time": None}
+        else:
+            open_issues = max(open_issues_count - pr_metrics.get("open_prs", 0), 0)
+            issue_metrics = self._summarize_issues(open_issues, results[2])
+
+        return contributor_count, pr_metrics, issue_metrics, release_info, activity_metrics
+
     async def _get_contributor_count(self, owner: str, name: str) -> int:
         """Get the number of contributors to the repository."""
         try:
@@ -79,81 +192,93 @@ class RepositoryAnalyzer:
 
     async def _analyze_pull_requests(self, owner: str, name: str) -> Dict[str, Any]:
         """Analyze pull request metrics."""
-        try:
-            prs = await self.github_api.get_pull_requests(owner, name, state="all", per_page=100)
-
-            if not prs:
-                return {"open_prs": 0, "avg_pr_merge_time": None, "pr_merge_rate": 0}
-
-            open_prs = len([pr for pr in prs if pr["state"] == "open"])
-            merged_prs = [pr for pr in prs if pr.get("merged_at")]
-
-            # Calculate average merge time for merged PRs
-            merge_times = []
-            for pr in merged_prs[-50:]:  # Last 50 merged PRs
-                if pr.get("created_at") and pr.get("merged_at"):
-                    created = datetime.fromisoformat(pr["created_at"].replace("Z", "+00:00"))
-                    merged = datetime.fromisoformat(pr["merged_at"].replace("Z", "+00:00"))
-                    merge_times.append((merged - created).total_seconds() / 86400)  # Days
-
-            avg_merge_time = sum(merge_times) / len(merge_times) if merge_times else None
-            merge_rate = len(merged_prs) / len(prs) if prs else 0
-
-            return {
-                "open_prs": open_prs,
-                "avg_pr_merge_time": avg_merge_time,
-                "pr_merge_rate": merge_rate,
-                "total_prs": len(prs)
-            }
-
-        except Exception:
+        # Merged PRs are all closed, so the merge metrics only need the closed list;
+        # the open count comes from the pagination links of a one-PR page.
+        # Either request can fail without losing what the other one found.
+        open_count, closed_prs = await asyncio.gather(
+            self.github_api.count_pull_requests(owner, name, state="open"),
+            self.github_api.get_pull_requests(owner, name, state="closed", per_page=50),
+            return_exceptions=True
+        )
+        if isinstance(open_count, Exception) and isinstance(closed_prs, Exception):
             return {"open_prs": 0, "avg_pr_merge_time": None, "pr_merge_rate": 0}
 
-    async def _analyze_issues(self, owner: str, name: str) -> Dict[str, Any]:
-        """Analyze issue metrics."""
-        try:
-            open_issues = await self.github_api.get_issues(owner, name, state="open")
-            closed_issues = await self.github_api.get_issues(owner, name, state="closed", per_page=50)
-
-            # Filter out pull requests (GitHub API includes PRs in issues)
-            open_issues = [issue for issue in open_issues if not issue.get("pull_request")]
-            closed_issues = [issue for issue in closed_issues if not issue.get("pull_request")]
+        open_count = open_count if not isinstance(open_count, Exception) else 0
+        closed_prs = closed_prs if not isinstance(closed_prs, Exception) else []
+        return self._summarize_pull_requests(open_count, closed_prs)
 
-            # Calculate average time to close issues
-            close_times = []
-            for issue in closed_issues:
-                if issue.get("created_at") and issue.get("closed_at"):
-                    created = datetime.fromisoformat(issue["created_at"].replace("Z", "+00:00"))
-                    closed = datetime.fromisoformat(issue["closed_at"].replace("Z", "+00:00"))
-                    close_times.append((closed - created).total_seconds() / 86400)  # Days
-
-            avg_close_time = sum(close_times) / len(close_times) if close_times else None
-
-            return {
-                "open_issues_actual": len(open_issues),
-                "avg_issue_close_time": avg_close_time,
-                "issue_response_activity": "high" if len(closed_issues) > 20 else "low"
-            }
-
-        except Exception:
-            return {"open_issues_actual": 0, "avg_issue_close_time": None}
+    def _summarize_pull_requests(self, open_count: int, closed_prs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Compute pull request metrics from the open PR count and recently closed PRs."""
+        if not open_count and not closed_prs:
+            return {"open_prs": 0, "avg_pr_merge_time": None, "pr_merge_rate": 0}
 
-    async def _get_release_info(self, owner: str, name: str) -> Dict[str, Any]:
+        merged_prs = [pr for pr in closed_prs if pr.get("merged_at")]
+
+        # Calculate average merge time for merged PRs
+        merge_times = []
+        for pr in merged_prs:
+            if pr.get("created_at") and pr.get("merged_at"):
+                created = _parse(pr["created_at"])
+                merged = _parse(pr["merged_at"])
+                merge_times.append((merged - created).total_seconds() / 86400)  # Days
+
+        avg_merge_time = sum(merge_times) / len(merge_times) if merge_times else None
+        merge_rate = len(merged_prs) / len(closed_prs) if closed_prs else 0
+
+        return {
+            "open_prs": open_count,
+            "avg_pr_merge_time": avg_merge_time,
+            "pr_merge_rate": merge_rate,
+            "total_prs": open_count + len(closed_prs)
+        }
+
+    async def _get_closed_issues(self, owner: str, name: str) -> List[Dict[str, Any]]:
+        """Get recently closed issues, excluding pull requests."""
+        closed_issues = await self.github_api.get_issues(owner, name, state="closed", per_page=30)
+
+        # Filter out pull requests (GitHub API includes PRs in issues)
+        return [issue for issue in closed_issues if not issue.get("pull_request")]
+
+    def _summarize_issues(self, open_count: int, closed_issues: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Compute issue metrics from the open issue count and recently closed issues."""
+        # Calculate average time to close issues
+        close_times = []
+        for issue in closed_issues:
+            if issue.get("created_at") and issue.get("closed_at"):
+                created = _parse(issue["created_at"])
+                closed = _parse(issue["closed_at"])
+                close_times.append((closed - created).total_seconds() / 86400)  # Days
+
+        avg_close_time = sum(close_times) / len(close_times) if close_times else None
+
+        return {
+            "open_issues_actual": open_count,
+            "avg_issue_close_time": avg_close_time,
+            "issue_response_activity": "high" if len(closed_issues) > 20 else "low"
+        }
+
+    async def _get_release_info(self, owner: str, name: str, now: datetime) -> Dict[str, Any]:
         """Get release information."""
         try:
             releases = await self.github_api.get_releases(owner, name)
+            return self._summarize_releases(releases, now)
+        except Exception:
+            return {"has_releases": False, "latest_release": None}
 
+    def _summarize_releases(self, releases: List[Dict[str, Any]], now: datetime) -> Dict[str, Any]:
+        """Compute release metrics from releases ordered newest first."""
+        try:
             if not releases:
                 return {"has_releases": False, "latest_release": None, "release_frequency": "none"}
 
             latest_release = releases[0]
-            latest_date = datetime.fromisoformat(latest_release["published_at"].replace("Z", "+00:00"))
-            days_since_release = (datetime.now(latest_date.tzinfo) - latest_date).days
+            latest_date = _parse(latest_release["published_at"])
+            days_since_release = (now - latest_date).days
 
             # Calculate release frequency
             if len(releases) > 1:
                 oldest_release = releases[-1]
-                oldest_date = datetime.fromisoformat(oldest_release["published_at"].replace("Z", "+00:00"))
+                oldest_date = _parse(oldest_release["published_at"])
                 days_span = (latest_date - oldest_date).days
                 avg_days_between_releases = days_span / (len(releases) - 1) if len(releases) > 1 else None
             else:
@@ -182,13 +307,17 @@ class RepositoryAnalyzer:
             recent_commits = sum(week["total"] for week in activity[-4:])
             total_commits = sum(week["total"] for week in activity)
 
-            activity_level = "high" if recent_commits > 50 else "medium" if recent_commits > 10 else "low"
-
-            return {
-                "commit_activity": activity_level,
-                "commits_last_month": recent_commits,
-                "commits_last_year": total_commits
-            }
+            return self._summarize_commit_activity(recent_commits, total_commits)
 
         except Exception:
             return {"commit_activity": "unknown", "commits_last_month": 0}
+
+    def _summarize_commit_activity(self, recent_commits: int, total_commits: int) -> Dict[str, Any]:
+        """Classify commit activity from last-month and last-year commit counts."""
+        activity_level = _COMMIT_ACTIVITY_LEVELS[bisect_left(_COMMIT_ACTIVITY_THRESHOLDS, recent_commits)]
+
+        return {
+            "commit_activity": activity_level,
+            "commits_last_month": recent_commits,
+            "commits_last_year": total_commits
+        }
@@ -21,10 +21,10 @@ async def test_diagram_generation():
     }
     
     print("Testing class diagram generation...")
-    diagram_path = await generator.generate_diagram(sample_repo)
+    diagram = await generator.generate_diagram(sample_repo)
     
-    if diagram_path:
-        print(f"✅ Diagram generated successfully: {diagram_path}")
+    if diagram:
+        print(f"✅ Diagram generated successfully: {len(diagram)} bytes of PNG")
         return True
     else:
         print("❌ Failed to generate diagram")